@@ -1,112 +1,230 @@
 import logging
+import os
 from flask import Blueprint, request, jsonify, current_app
 from paraphrase_service import ParaphraseService
 from rate_limiter import RateLimiter
+from api_keys import ApiKeyStore, QUOTA_TIERS
+from scheduler import FairScheduler, SchedulerBusy
+from engine_router import QUALITY_TIERS
 import time
 
 api_bp = Blueprint('api', __name__)
 paraphrase_service = ParaphraseService()
 rate_limiter = RateLimiter()
+character_limiter = RateLimiter()
+api_keys = ApiKeyStore()
+scheduler = FairScheduler(
+    max_concurrent=int(os.environ.get('MAX_CONCURRENT_PARAPHRASES', 4))
+)
+SCHEDULER_TIMEOUT = float(os.environ.get('SCHEDULER_TIMEOUT', 30))
 
 logger = logging.getLogger(__name__)
 
+def _get_api_key():
+    """Extract the API key from X-API-Key or an Authorization bearer token"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        return api_key.strip()
+
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.lower().startswith('bearer '):
+        return auth_header[7:].strip()
+
+    return None
+
+def _authenticate():
+    """
+    Resolve the calling client
+
+    Returns:
+        (client, None) on success or (None, error_response) for an invalid key,
+        which is a 429 once the caller's IP has used its anonymous rate limit
+    """
+    api_key = _get_api_key()
+
+    if not api_key:
+        # request.remote_addr already honours trusted proxies (see app.py)
+        return api_keys.anonymous(request.remote_addr), None
+
+    client = api_keys.lookup(api_key)
+    if client is None:
+        # Failed lookups use the caller's anonymous allowance so keys cannot
+        # be guessed faster than anonymous requests are allowed
+        anonymous = api_keys.anonymous(request.remote_addr)
+        if not rate_limiter.reserve(anonymous.client_id,
+                                    limit=anonymous.quota['requests_per_minute']):
+            return None, _rate_limit_exceeded('Too many failed authentication attempts.')
+
+        return None, (jsonify({
+            'error': 'Invalid API key',
+            'message': 'The supplied API key is not recognised'
+        }), 401)
+
+    return client, None
+
+def _rate_limit_exceeded(message):
+    return jsonify({
+        'error': 'Rate limit exceeded',
+        'message': message,
+        'retry_after': rate_limiter.window_size
+    }), 429
+
+def _reserve_quota(client, characters):
+    """
+    Reserve one request and the given characters against the client's quota
+
+    Returns:
+        An error response if either limit is exceeded, otherwise None
+    """
+    quota = client.quota
+
+    if not rate_limiter.reserve(client.client_id, limit=quota['requests_per_minute']):
+        return _rate_limit_exceeded('Too many requests. Please try again later.')
+
+    if not character_limiter.reserve(client.client_id, cost=characters,
+                                     limit=quota['characters_per_minute']):
+        rate_limiter.refund(client.client_id)
+        return _rate_limit_exceeded('Character quota exceeded. Please try again later.')
+
+    return None
+
+def _refund_quota(client, characters):
+    """Give back a reservation for work that was not completed"""
+    rate_limiter.refund(client.client_id)
+    character_limiter.refund(client.client_id, cost=characters)
+
+def _validate_text(text):
+    """Return an error response for invalid text, or None if it is acceptable"""
+    if not isinstance(text, str) or not text.strip():
+        return jsonify({
+            'error': 'Empty text',
+            'message': 'Text cannot be empty'
+        }), 400
+
+    if len(text.strip()) > 2000:
+        return jsonify({
+            'error': 'Text too long',
+            'message': 'Text must be less than 2000 characters'
+        }), 400
+
+    return None
+
+def _get_generation_params(data, client):
+    """Read optional generation parameters, falling back to the client's defaults"""
+    max_length = data.get('max_length', client.settings.get('max_length', 100))
+    temperature = data.get('temperature', client.settings.get('temperature', 0.7))
+    tier = data.get('tier', client.settings.get('tier', 'balanced'))
+    max_latency_ms = data.get('max_latency_ms')
+
+    # Validate optional parameters
+    if not isinstance(max_length, int) or max_length < 10 or max_length > 200:
+        max_length = 100
+
+    if not isinstance(temperature, (int, float)) or temperature < 0.1 or temperature > 2.0:
+        temperature = 0.7
+
+    if tier not in QUALITY_TIERS:
+        tier = 'balanced'
+
+    if isinstance(max_latency_ms, bool) or not isinstance(max_latency_ms, (int, float)) \
+            or max_latency_ms <= 0:
+        max_latency_ms = None
+
+    return {
+        'max_length': max_length,
+        'temperature': temperature,
+        'tier': tier,
+        'max_latency_ms': max_latency_ms
+    }
+
 @api_bp.route('/paraphrase', methods=['POST'])
 def paraphrase():
     """
     Paraphrase text endpoint
-    
+
     Expected JSON payload:
     {
         "text": "Text to paraphrase",
         "max_length": 100 (optional),
-        "temperature": 0.7 (optional)
+        "temperature": 0.7 (optional),
+        "tier": "balanced" (optional: fast, balanced or quality),
+        "max_latency_ms": 500 (optional)
     }
     """
     try:
-        # Get client IP for rate limiting
-        client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        
-        # Check rate limit
-        if not rate_limiter.is_allowed(client_ip):
-            return jsonify({
-                'error': 'Rate limit exceeded',
-                'message': 'Too many requests. Please try again later.',
-                'retry_after': 60
-            }), 429
-        
+        client, error = _authenticate()
+        if error:
+            return error
+
+        quota = client.quota
+
         # Validate request
         if not request.is_json:
             return jsonify({
                 'error': 'Invalid request',
                 'message': 'Content-Type must be application/json'
             }), 400
-        
+
         data = request.get_json()
-        
+
         if not data or 'text' not in data:
             return jsonify({
                 'error': 'Missing required field',
                 'message': 'The "text" field is required'
             }), 400
-        
-        text = data['text'].strip()
-        
+
         # Validate text input
-        if not text:
-            return jsonify({
-                'error': 'Empty text',
-                'message': 'Text cannot be empty'
-            }), 400
-        
-        if len(text) > 2000:
-            return jsonify({
-                'error': 'Text too long',
-                'message': 'Text must be less than 2000 characters'
-            }), 400
-        
-        # Optional parameters
-        max_length = data.get('max_length', 100)
-        temperature = data.get('temperature', 0.7)
-        
-        # Validate optional parameters
-        if not isinstance(max_length, int) or max_length < 10 or max_length > 200:
-            max_length = 100
-        
-        if not isinstance(temperature, (int, float)) or temperature < 0.1 or temperature > 2.0:
-            temperature = 0.7
-        
+        error = _validate_text(data['text'])
+        if error:
+            return error
+
+        text = data['text'].strip()
+
+        # Check rate limits; the reservation covers the request while it runs
+        error = _reserve_quota(client, len(text))
+        if error:
+            return error
+
+        params = _get_generation_params(data, client)
+
         start_time = time.time()
-        
+
         # Perform paraphrasing
         try:
-            paraphrased_text = paraphrase_service.paraphrase(
-                text=text,
-                max_length=max_length,
-                temperature=temperature
-            )
+            with scheduler.slot(client.client_id, weight=quota['weight'],
+                                cost=len(text), timeout=SCHEDULER_TIMEOUT):
+                result = paraphrase_service.paraphrase_detailed(
+                    text=text,
+                    vocabulary=client.vocabulary,
+                    **params
+                )
+        except SchedulerBusy:
+            _refund_quota(client, len(text))
+            return jsonify({
+                'error': 'Service busy',
+                'message': 'The service is at capacity. Please try again shortly.',
+                'retry_after': 5
+            }), 503
         except Exception as e:
+            _refund_quota(client, len(text))
             logger.error(f"Paraphrasing failed: {str(e)}")
             return jsonify({
                 'error': 'Paraphrasing failed',
                 'message': 'Unable to process the text. Please try again.'
             }), 500
-        
+
         processing_time = round(time.time() - start_time, 3)
-        
-        # Record successful request for rate limiting
-        rate_limiter.record_request(client_ip)
-        
+
         return jsonify({
             'success': True,
             'original_text': text,
-            'paraphrased_text': paraphrased_text,
+            'paraphrased_text': result['paraphrased_text'],
+            'engine': result['engine'],
+            'served_tier': result['served_tier'],
             'processing_time_seconds': processing_time,
-            'parameters': {
-                'max_length': max_length,
-                'temperature': temperature
-            }
+            'parameters': params
         })
-    
+
     except Exception as e:
         logger.error(f"Unexpected error in paraphrase endpoint: {str(e)}")
         return jsonify({
@@ -114,6 +232,108 @@ def paraphrase():
             'message': 'An unexpected error occurred'
         }), 500
 
+@api_bp.route('/paraphrase/batch', methods=['POST'])
+def paraphrase_batch():
+    """
+    Paraphrase several texts in one request
+
+    Expected JSON payload:
+    {
+        "texts": ["First text", "Second text"],
+        "max_length": 100 (optional),
+        "temperature": 0.7 (optional),
+        "tier": "balanced" (optional),
+        "max_latency_ms": 500 (optional, applies to each text)
+    }
+    """
+    try:
+        client, error = _authenticate()
+        if error:
+            return error
+
+        quota = client.quota
+
+        if not request.is_json:
+            return jsonify({
+                'error': 'Invalid request',
+                'message': 'Content-Type must be application/json'
+            }), 400
+
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('texts'), list) or not data['texts']:
+            return jsonify({
+                'error': 'Missing required field',
+                'message': 'The "texts" field must be a non-empty list'
+            }), 400
+
+        if len(data['texts']) > quota['max_batch_size']:
+            return jsonify({
+                'error': 'Batch too large',
+                'message': f"Batch size is limited to {quota['max_batch_size']} texts for your plan"
+            }), 400
+
+        for text in data['texts']:
+            error = _validate_text(text)
+            if error:
+                return error
+
+        texts = [text.strip() for text in data['texts']]
+        total_characters = sum(len(text) for text in texts)
+
+        error = _reserve_quota(client, total_characters)
+        if error:
+            return error
+
+        params = _get_generation_params(data, client)
+
+        start_time = time.time()
+
+        try:
+            results = []
+            for text in texts:
+                # One slot per text so a large batch queues between items
+                # instead of holding a slot for its whole duration
+                with scheduler.slot(client.client_id, weight=quota['weight'],
+                                    cost=len(text), timeout=SCHEDULER_TIMEOUT):
+                    result = paraphrase_service.paraphrase_detailed(
+                        text=text,
+                        vocabulary=client.vocabulary,
+                        **params
+                    )
+                result['original_text'] = text
+                results.append(result)
+        except SchedulerBusy:
+            _refund_quota(client, total_characters)
+            return jsonify({
+                'error': 'Service busy',
+                'message': 'The service is at capacity. Please try again shortly.',
+                'retry_after': 5
+            }), 503
+        except Exception as e:
+            _refund_quota(client, total_characters)
+            logger.error(f"Batch paraphrasing failed: {str(e)}")
+            return jsonify({
+                'error': 'Paraphrasing failed',
+                'message': 'Unable to process the texts. Please try again.'
+            }), 500
+
+        processing_time = round(time.time() - start_time, 3)
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'processing_time_seconds': processing_time,
+            'parameters': params
+        })
+
+    except Exception as e:
+        logger.error(f"Unexpected error in batch endpoint: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': 'An unexpected error occurred'
+        }), 500
+
 @api_bp.route('/paraphrase', methods=['GET'])
 def paraphrase_info():
     """Get information about the paraphrase endpoint"""
@@ -122,18 +342,24 @@ def paraphrase_info():
         'method': 'POST',
         'description': 'Paraphrase text using AI models',
         'required_fields': ['text'],
-        'optional_fields': ['max_length', 'temperature'],
+        'optional_fields': ['max_length', 'temperature', 'tier', 'max_latency_ms'],
+        'authentication': 'Optional API key via X-API-Key header or Authorization: Bearer <key>',
         'limits': {
             'max_text_length': 2000,
             'max_length_range': [10, 200],
             'temperature_range': [0.1, 2.0],
-            'rate_limit': '60 requests per minute'
+            'temperature_local_engines': 'Synonym replacement probability; values of 1.0 and above replace every known word',
+            'tiers': list(QUALITY_TIERS),
+            'rate_limit': f"{QUOTA_TIERS['anonymous']['requests_per_minute']} requests per minute "
+                          "per IP without an API key; see quota_tiers for keyed limits",
+            'quota_tiers': QUOTA_TIERS
         },
         'example': {
             'request': {
                 'text': 'The quick brown fox jumps over the lazy dog.',
                 'max_length': 50,
-                'temperature': 0.7
+                'temperature': 0.7,
+                'tier': 'balanced'
             }
         }
     })
@@ -141,13 +367,31 @@ def paraphrase_info():
 @api_bp.route('/status', methods=['GET'])
 def api_status():
     """Get API status and model information"""
+    client, error = _authenticate()
+    if error:
+        return error
+
     model_status = paraphrase_service.get_model_status()
     return jsonify({
         'api_status': 'active',
         'model_loaded': model_status['loaded'],
         'model_name': model_status['model_name'],
-        'supported_operations': ['paraphrase'],
+        'supported_operations': ['paraphrase', 'paraphrase_batch'],
+        'engines': model_status['engines'],
+        'client': {
+            'name': client.name,
+            'quota_tier': client.quota_tier
+        },
         'rate_limits': {
-            'requests_per_minute': 60
-        }
+            'requests_per_minute': client.quota['requests_per_minute'],
+            'characters_per_minute': client.quota['characters_per_minute'],
+            'max_batch_size': client.quota['max_batch_size'],
+            'remaining_requests': rate_limiter.get_remaining_requests(
+                client.client_id, limit=client.quota['requests_per_minute']
+            ),
+            'remaining_characters': character_limiter.get_remaining_requests(
+                client.client_id, limit=client.quota['characters_per_minute']
+            )
+        },
+        'scheduler': scheduler.get_status()
     })
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Optional
+from vocabulary import COMPREHENSIVE_SYNONYMS
+
+logger = logging.getLogger(__name__)
+
+# Quota tiers available to API keys. Anonymous clients (no key) get the
+# "anonymous" tier, which matches the original public limits.
+QUOTA_TIERS = {
+    'anonymous': {
+        'requests_per_minute': 60,
+        'characters_per_minute': 30000,
+        'max_batch_size': 1,
+        'weight': 1,
+    },
+    'basic': {
+        'requests_per_minute': 120,
+        'characters_per_minute': 100000,
+        'max_batch_size': 10,
+        'weight': 2,
+    },
+    'pro': {
+        'requests_per_minute': 600,
+        'characters_per_minute': 500000,
+        'max_batch_size': 50,
+        'weight': 4,
+    },
+    'enterprise': {
+        'requests_per_minute': 3000,
+        'characters_per_minute': 2000000,
+        'max_batch_size': 100,
+        'weight': 8,
+    },
+}
+
+SHA256_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+# Settings a key may override; anything else in the config is ignored
+ALLOWED_SETTINGS = ('max_length', 'temperature', 'tier')
+
+
+class ApiClient:
+    """Resolved identity of a caller: either an API key or an anonymous IP"""
+
+    def __init__(self, client_id: str, name: str, quota_tier: str, quota: dict,
+                 vocabulary: Optional[dict] = None, settings: Optional[dict] = None):
+        self.client_id = client_id
+        self.name = name
+        self.quota_tier = quota_tier
+        self.quota = quota
+        self.vocabulary = vocabulary
+        self.settings = settings or {}
+
+
+class ApiKeyStore:
+    """
+    In-memory API key registry
+
+    Keys are read once from the API_KEYS environment variable (JSON) or the
+    file named by API_KEYS_FILE, and indexed by their SHA-256 digest so that
+    lookups during a request are a single dictionary access with no I/O.
+
+    Expected format:
+    [
+        {
+            "key": "plain-text-key" or "sha256:<hex digest>",
+            "name": "acme-prod",
+            "quota_tier": "pro",
+            "quota": {"requests_per_minute": 1000} (optional overrides),
+            "vocabulary": {"utilize": "use"} (optional),
+            "settings": {"temperature": 0.9} (optional)
+        }
+    ]
+    """
+
+    def __init__(self):
+        self.clients: Dict[str, ApiClient] = {}
+        self.reload()
+
+    def reload(self):
+        """(Re)load key definitions from the environment"""
+        entries = self._read_config()
+        clients = {}
+
+        for entry in entries:
+            try:
+                digest, client = self._build_client(entry)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                logger.error(f"Skipping invalid API key entry: {str(e)}")
+                continue
+            clients[digest] = client
+
+        self.clients = clients
+        logger.info(f"Loaded {len(self.clients)} API keys")
+
+    def _read_config(self) -> list:
+        """Read the raw key list from API_KEYS or API_KEYS_FILE"""
+        raw = os.environ.get('API_KEYS')
+        path = os.environ.get('API_KEYS_FILE')
+
+        try:
+            if not raw and path:
+                with open(path) as f:
+                    raw = f.read()
+
+            if not raw:
+                return []
+
+            entries = json.loads(raw)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load API keys: {str(e)}")
+            return []
+
+        if not isinstance(entries, list):
+            logger.error("API key configuration must be a JSON list")
+            return []
+
+        return entries
+
+    def _build_client(self, entry: dict):
+        """Validate a config entry and return its (digest, client) pair"""
+        if not isinstance(entry, dict):
+            raise TypeError("entry must be an object")
+
+        key = entry['key']
+        if not isinstance(key, str) or not key:
+            raise TypeError("'key' must be a non-empty string")
+
+        if key.startswith('sha256:'):
+            digest = key[len('sha256:'):].lower()
+            if not SHA256_DIGEST.match(digest):
+                raise ValueError("'sha256:' keys must be 64 hex characters")
+        else:
+            digest = self._hash_key(key)
+
+        overrides = self._get_mapping(entry, 'quota')
+        custom_vocabulary = self._get_mapping(entry, 'vocabulary')
+        raw_settings = self._get_mapping(entry, 'settings')
+
+        quota_tier = entry.get('quota_tier', 'basic')
+        if quota_tier not in QUOTA_TIERS or quota_tier == 'anonymous':
+            raise ValueError(f"unknown quota tier '{quota_tier}'")
+
+        quota = dict(QUOTA_TIERS[quota_tier])
+        for field, value in overrides.items():
+            if (field in quota and not isinstance(value, bool)
+                    and isinstance(value, (int, float)) and value > 0):
+                quota[field] = value
+
+        # Merge custom vocabulary once here so requests reuse the same dict
+        vocabulary = None
+        if custom_vocabulary:
+            for replacement in custom_vocabulary.values():
+                if not isinstance(replacement, str) or not replacement.strip():
+                    raise ValueError("vocabulary replacements must be non-empty strings")
+
+            vocabulary = dict(COMPREHENSIVE_SYNONYMS)
+            vocabulary.update({
+                word.lower(): replacement.strip()
+                for word, replacement in custom_vocabulary.items()
+            })
+
+        settings = {
+            field: value for field, value in raw_settings.items()
+            if field in ALLOWED_SETTINGS
+        }
+
+        name = entry.get('name', digest[:8])
+        client = ApiClient(
+            client_id=f"key:{digest}",
+            name=name,
+            quota_tier=quota_tier,
+            quota=quota,
+            vocabulary=vocabulary,
+            settings=settings
+        )
+        return digest, client
+
+    @staticmethod
+    def _get_mapping(entry: dict, field: str) -> dict:
+        """Return an optional object-valued field, rejecting other JSON types"""
+        value = entry.get(field, {})
+        if not isinstance(value, dict):
+            raise TypeError(f"'{field}' must be an object")
+        return value
+
+    @staticmethod
+    def _hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> Optional[ApiClient]:
+        """Return the client for an API key, or None if the key is unknown"""
+        return self.clients.get(self._hash_key(key))
+
+    @staticmethod
+    def anonymous(client_ip: str) -> ApiClient:
+        """Build a client for an unauthenticated caller identified by IP"""
+        return ApiClient(
+            client_id=f"ip:{client_ip}",
+            name='anonymous',
+            quota_tier='anonymous',
+            quota=QUOTA_TIERS['anonymous']
+        )
@@ -2,6 +2,7 @@ import os
 import logging
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from api import api_bp
 from rate_limiter import RateLimiter
 
@@ -12,6 +13,10 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
+# Trust X-Forwarded-For only from the configured number of proxies so that
+# request.remote_addr (used for anonymous rate limiting) cannot be spoofed
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get("TRUSTED_PROXY_COUNT", 1)))
+
 # Enable CORS for API access
 CORS(app)
 
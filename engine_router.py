@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Engines that can serve a paraphrase request
+ENGINE_MODEL = 'huggingface'
+ENGINE_LINGUISTIC = 'local-linguistic'
+ENGINE_RULES = 'local-rules'
+
+# Quality tiers ordered from fastest to highest quality
+QUALITY_TIERS = ('fast', 'balanced', 'quality')
+
+# Above this length the balanced tier skips the model and stays local
+BALANCED_MODEL_MAX_CHARS = 500
+
+# Starting latency estimates in milliseconds; estimates decay back toward
+# these when an engine has not been measured for a while
+LATENCY_PRIORS_MS = {
+    ENGINE_MODEL: 1500.0,
+    ENGINE_LINGUISTIC: 1.0,
+    ENGINE_RULES: 0.2,
+}
+
+
+class EngineRouter:
+    """
+    Choose which paraphrase engine serves a request
+
+    The router keeps a moving average of each engine's latency and a simple
+    circuit breaker for the upstream model. A request's plan starts at the
+    requested tier and steps down to faster tiers, skipping engines that are
+    unhealthy or expected to exceed the client's latency budget.
+
+    Skipping the model stops it from being measured, so estimates decay back
+    toward their prior with the given half-life, and once per probe interval
+    a budgeted request is allowed to try the model anyway.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown_seconds: float = 30,
+                 smoothing: float = 0.2, latency_half_life: float = 120,
+                 probe_interval: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.smoothing = smoothing
+        self.latency_half_life = latency_half_life
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+
+        # Latency estimates in milliseconds, refined as requests complete
+        self.latency_ms = dict(LATENCY_PRIORS_MS)
+        now = time.time()
+        self.latency_updated = {engine: now for engine in LATENCY_PRIORS_MS}
+        self.last_probe = 0.0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def plan(self, tier: str, text_length: int, max_latency_ms: Optional[float] = None,
+             model_configured: bool = True) -> List[Tuple[str, str]]:
+        """
+        Build the ordered list of engines to try for a request
+
+        Args:
+            tier: Requested quality tier
+            text_length: Length of the text in characters
+            max_latency_ms: Optional latency budget supplied by the client
+            model_configured: Whether the upstream model has credentials
+
+        Returns:
+            List of (engine, served_tier) pairs, best first. The fast tier is
+            always included so a request can be served even if nothing else
+            fits the budget.
+        """
+        if tier not in QUALITY_TIERS:
+            raise ValueError(f"Unknown tier: {tier}")
+
+        candidates = {
+            'quality': [ENGINE_MODEL],
+            'balanced': [ENGINE_LINGUISTIC],
+            'fast': [ENGINE_RULES],
+        }
+        if text_length <= BALANCED_MODEL_MAX_CHARS:
+            candidates['balanced'].insert(0, ENGINE_MODEL)
+
+        model_usable = model_configured and self.is_model_healthy()
+        plan = []
+        seen = set()
+
+        for served_tier in reversed(QUALITY_TIERS[:QUALITY_TIERS.index(tier) + 1]):
+            for engine in candidates[served_tier]:
+                if engine in seen:
+                    continue
+                if engine == ENGINE_MODEL and not model_usable:
+                    continue
+                if (engine != ENGINE_RULES and max_latency_ms is not None
+                        and self.estimate_latency(engine) > max_latency_ms):
+                    # Occasionally let the model through to re-measure it
+                    if engine != ENGINE_MODEL or not self._claim_probe():
+                        continue
+                plan.append((engine, served_tier))
+                seen.add(engine)
+
+        return plan
+
+    def record_success(self, engine: str, latency_ms: float):
+        """Update the latency estimate after a completed call"""
+        self.record_latency(engine, latency_ms)
+        if engine == ENGINE_MODEL:
+            with self._lock:
+                self.consecutive_failures = 0
+
+    def record_latency(self, engine: str, latency_ms: float):
+        """
+        Update the latency estimate without affecting health
+
+        Used when a call was cut short by the client's latency budget: the
+        engine is not unhealthy, but it was at least this slow.
+        """
+        with self._lock:
+            now = time.time()
+            current = self._decayed_latency(engine, now)
+            self.latency_ms[engine] = current + self.smoothing * (latency_ms - current)
+            self.latency_updated[engine] = now
+
+    def estimate_latency(self, engine: str) -> float:
+        """Current latency estimate in milliseconds, decayed toward the prior"""
+        with self._lock:
+            return self._decayed_latency(engine, time.time())
+
+    def _decayed_latency(self, engine: str, now: float) -> float:
+        """Decay the stored estimate by its age; caller must hold the lock"""
+        prior = LATENCY_PRIORS_MS[engine]
+        age = max(0.0, now - self.latency_updated[engine])
+        return prior + (self.latency_ms[engine] - prior) * 0.5 ** (age / self.latency_half_life)
+
+    def _claim_probe(self) -> bool:
+        """Allow at most one over-budget model probe per probe interval"""
+        with self._lock:
+            now = time.time()
+            if now - self.last_probe < self.probe_interval:
+                return False
+            self.last_probe = now
+            return True
+
+    def record_failure(self, engine: str):
+        """Count an upstream failure and open the circuit if it keeps failing"""
+        if engine != ENGINE_MODEL:
+            return
+
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.unhealthy_until = time.time() + self.cooldown_seconds
+                logger.warning(
+                    f"Model marked unhealthy for {self.cooldown_seconds}s "
+                    f"after {self.consecutive_failures} failures"
+                )
+
+    def is_model_healthy(self) -> bool:
+        """False while the circuit breaker is open"""
+        return time.time() >= self.unhealthy_until
+
+    def get_status(self) -> dict:
+        """Get engine health and latency estimates"""
+        return {
+            'model_healthy': self.is_model_healthy(),
+            'model_consecutive_failures': self.consecutive_failures,
+            'latency_ms': {
+                engine: round(self.estimate_latency(engine), 3) for engine in LATENCY_PRIORS_MS
+            }
+        }
@@ -1,10 +1,13 @@
 import logging
 import os
+import re
+import time
 from typing import Optional
 import requests
 import json
 import random
 from vocabulary import COMPREHENSIVE_SYNONYMS
+from engine_router import EngineRouter, ENGINE_MODEL, ENGINE_LINGUISTIC, QUALITY_TIERS
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +15,7 @@ class ParaphraseService:
     def __init__(self):
         self.model_name = "Hugging Face API"
         self.is_loaded = True  # Always ready for API calls
+        self.router = EngineRouter()
         
         # Built-in paraphrasing patterns as fallback
         self.fallback_patterns = [
@@ -27,39 +31,103 @@ class ParaphraseService:
         self.is_loaded = True
         logger.info("API-based paraphrasing service ready")
     
-    def paraphrase(self, text: str, max_length: int = 100, temperature: float = 0.7) -> str:
+    def paraphrase(self, text: str, max_length: int = 100, temperature: float = 0.7,
+                   vocabulary: Optional[dict] = None, tier: str = 'balanced',
+                   max_latency_ms: Optional[float] = None) -> str:
         """
-        Paraphrase the given text using Hugging Face API or fallback patterns
+        Paraphrase the given text and return only the paraphrased string
+        
+        See paraphrase_detailed for the arguments.
+        """
+        return self.paraphrase_detailed(
+            text, max_length, temperature, vocabulary, tier, max_latency_ms
+        )['paraphrased_text']
+    
+    def paraphrase_detailed(self, text: str, max_length: int = 100, temperature: float = 0.7,
+                            vocabulary: Optional[dict] = None, tier: str = 'balanced',
+                            max_latency_ms: Optional[float] = None) -> dict:
+        """
+        Paraphrase the given text with the engine chosen for the requested tier
         
         Args:
             text: Text to paraphrase
             max_length: Maximum length of output
-            temperature: Sampling temperature for generation
+            temperature: Sampling temperature for the model; for local engines
+                it is the probability of replacing a known word with a synonym,
+                capped at 1.0
+            vocabulary: Synonym map used by local engines (defaults to COMPREHENSIVE_SYNONYMS)
+            tier: Quality tier - 'fast', 'balanced' or 'quality'
+            max_latency_ms: Optional latency budget; slower engines are skipped
             
         Returns:
-            Paraphrased text
+            Dict with the paraphrased text, the engine that served it and the
+            tier it was served at
         """
         if not text or not text.strip():
             raise ValueError("Text cannot be empty")
         
+        if tier not in QUALITY_TIERS:
+            raise ValueError(f"Unknown tier: {tier}")
+        
         try:
-            # First try Hugging Face Inference API
-            hf_result = self._try_hugging_face_api(text, max_length, temperature)
-            if hf_result:
-                return hf_result
+            start_time = time.monotonic()
+            plan = self.router.plan(
+                tier, len(text), max_latency_ms,
+                model_configured=self._get_hf_token() is not None
+            )
             
-            # Fallback to built-in patterns with intelligent modifications
-            return self._intelligent_fallback_paraphrase(text, temperature)
+            for engine, served_tier in plan:
+                if engine == ENGINE_MODEL:
+                    # Never let the upstream call run past the client's budget
+                    timeout = 10
+                    budget_limited = False
+                    if max_latency_ms is not None:
+                        elapsed = time.monotonic() - start_time
+                        budget_timeout = max(0.1, max_latency_ms / 1000 - elapsed)
+                        if budget_timeout < timeout:
+                            timeout = budget_timeout
+                            budget_limited = True
+                    result = self._try_hugging_face_api(
+                        text, max_length, temperature, timeout, budget_limited
+                    )
+                else:
+                    engine_start = time.monotonic()
+                    result = self._intelligent_fallback_paraphrase(
+                        text, temperature, vocabulary,
+                        restructure=engine == ENGINE_LINGUISTIC
+                    )
+                    self.router.record_success(engine, (time.monotonic() - engine_start) * 1000)
+                
+                if result:
+                    return {
+                        'paraphrased_text': result,
+                        'engine': engine,
+                        'served_tier': served_tier
+                    }
+            
+            raise Exception("No paraphrase engine available")
             
         except Exception as e:
             logger.error(f"Error during paraphrasing: {str(e)}")
             raise Exception(f"Paraphrasing failed: {str(e)}")
     
-    def _try_hugging_face_api(self, text: str, max_length: int, temperature: float) -> Optional[str]:
-        """Try to use Hugging Face Inference API"""
+    def _get_hf_token(self) -> Optional[str]:
+        """Read the Hugging Face token from the environment"""
+        return os.environ.get('HF_TOKEN') or os.environ.get('HUGGINGFACE_TOKEN')
+    
+    def _try_hugging_face_api(self, text: str, max_length: int, temperature: float,
+                              timeout: float = 10, budget_limited: bool = False) -> Optional[str]:
+        """
+        Try to use Hugging Face Inference API
+        
+        When budget_limited is set the timeout comes from the client's latency
+        budget, so a timeout only updates the latency estimate instead of
+        counting against the model's health.
+        """
+        request_start = time.monotonic()
         try:
             # Check if HF_TOKEN is available in environment
-            hf_token = os.environ.get('HF_TOKEN') or os.environ.get('HUGGINGFACE_TOKEN')
+            hf_token = self._get_hf_token()
             
             if not hf_token:
                 logger.info("No Hugging Face token found, using fallback method")
@@ -77,9 +145,12 @@ class ParaphraseService:
                 }
             }
             
-            response = requests.post(api_url, headers=headers, json=payload, timeout=10)
+            response = requests.post(api_url, headers=headers, json=payload, timeout=timeout)
             
-            if response.status_code == 200:
+            if response.status_code != 200:
+                self.router.record_failure(ENGINE_MODEL)
+            else:
+                self.router.record_success(ENGINE_MODEL, (time.monotonic() - request_start) * 1000)
                 result = response.json()
                 if isinstance(result, list) and len(result) > 0:
                     generated_text = result[0].get('generated_text', '').strip()
@@ -88,11 +159,24 @@ class ParaphraseService:
             
             return None
             
+        except requests.Timeout as e:
+            elapsed_ms = (time.monotonic() - request_start) * 1000
+            if budget_limited:
+                logger.info(f"Hugging Face API exceeded latency budget after {elapsed_ms:.0f}ms")
+                self.router.record_latency(ENGINE_MODEL, elapsed_ms)
+            else:
+                logger.warning(f"Hugging Face API timed out: {str(e)}")
+                self.router.record_failure(ENGINE_MODEL)
+            return None
+            
         except Exception as e:
             logger.warning(f"Hugging Face API failed: {str(e)}")
+            self.router.record_failure(ENGINE_MODEL)
             return None
     
-    def _intelligent_fallback_paraphrase(self, text: str, temperature: float) -> str:
+    def _intelligent_fallback_paraphrase(self, text: str, temperature: float,
+                                         vocabulary: Optional[dict] = None,
+                                         restructure: bool = True) -> str:
         """Create intelligent paraphrases using linguistic patterns"""
         # Clean the input text first
         original_text = text.strip()
@@ -112,11 +196,15 @@ class ParaphraseService:
                 break
         
         # Apply intelligent transformations
-        paraphrased = self._apply_linguistic_transformations(original_text, temperature)
+        paraphrased = self._apply_linguistic_transformations(
+            original_text, temperature, vocabulary, restructure
+        )
         
         return paraphrased
     
-    def _apply_linguistic_transformations(self, text: str, temperature: float) -> str:
+    def _apply_linguistic_transformations(self, text: str, temperature: float,
+                                          vocabulary: Optional[dict] = None,
+                                          restructure: bool = True) -> str:
         """Apply various linguistic transformations to create meaningful paraphrases"""
         sentences = text.split('. ')
         transformed_sentences = []
@@ -126,32 +214,34 @@ class ParaphraseService:
                 continue
                 
             # Apply different transformation techniques
-            transformed = self._transform_sentence(sentence.strip(), temperature)
+            transformed = self._transform_sentence(
+                sentence.strip(), temperature, vocabulary, restructure
+            )
             transformed_sentences.append(transformed)
         
         return '. '.join(transformed_sentences)
     
-    def _transform_sentence(self, sentence: str, temperature: float) -> str:
+    def _transform_sentence(self, sentence: str, temperature: float,
+                            vocabulary: Optional[dict] = None,
+                            restructure: bool = True) -> str:
         """Transform a single sentence using various techniques"""
         words = sentence.split()
         
         if len(words) < 3:
             return sentence
         
-        # Apply transformations based on temperature
         transformations = []
         
         # Always apply synonym replacement
-        transformed = self._replace_synonyms(sentence)
+        transformed = self._replace_synonyms(sentence, vocabulary, temperature)
         transformations.append(transformed)
         
-        # Higher temperature = more transformations
-        if temperature > 0.5:
+        # The fast tier stops at synonyms; the linguistic engine goes further
+        if restructure:
             # Sentence restructuring
             restructured = self._restructure_sentence(sentence)
             transformations.append(restructured)
-        
-        if temperature > 0.8:
+            
             # Active/passive voice changes
             voice_changed = self._change_voice(sentence)
             transformations.append(voice_changed)
@@ -165,17 +255,22 @@ class ParaphraseService:
         
         return best_transformation
     
-    def _replace_synonyms(self, sentence: str) -> str:
+    def _replace_synonyms(self, sentence: str, vocabulary: Optional[dict] = None,
+                          temperature: float = 0.7) -> str:
         """Replace common words with synonyms"""
-        # Use comprehensive universal vocabulary database
-        synonyms = COMPREHENSIVE_SYNONYMS
+        # Use comprehensive universal vocabulary database unless a per-key one is given
+        synonyms = vocabulary if vocabulary is not None else COMPREHENSIVE_SYNONYMS
+        
+        # Temperature is the replacement chance (default 0.7 = 70%); the API
+        # accepts up to 2.0 for the model, so cap it for local engines
+        replace_probability = min(temperature, 1.0)
         
         words = sentence.split()
         for i, word in enumerate(words):
             # Clean word (remove punctuation for matching)
             clean_word = word.lower().strip('.,!?;:()""''')
             
-            if clean_word in synonyms and random.random() < 0.7:  # 70% chance to replace
+            if clean_word in synonyms and random.random() < replace_probability:
                 # Preserve original punctuation and capitalization
                 punctuation = ''.join(c for c in word if c in '.,!?;:()""''')
                 replacement = synonyms[clean_word]
@@ -209,15 +304,17 @@ class ParaphraseService:
     
     def _change_voice(self, sentence: str) -> str:
         """Attempt simple active/passive voice changes"""
-        # Simple patterns for voice transformation
-        if ' has ' in sentence and ' transformed ' in sentence:
-            return sentence.replace('has transformed', 'transformed')
-        
-        if ' use ' in sentence:
-            return sentence.replace('use', 'employ')
+        # Simple patterns for voice transformation, matched on whole words so
+        # that e.g. 'house' or 'users' are left alone
+        patterns = [
+            (r'\bhas transformed\b', 'transformed'),
+            (r'\buse\b', 'employ'),
+            (r'\bcreated\b', 'brought about'),
+        ]
         
-        if ' created ' in sentence:
-            return sentence.replace('created', 'brought about')
+        for pattern, replacement in patterns:
+            if re.search(pattern, sentence):
+                return re.sub(pattern, replacement, sentence)
         
         return sentence
     
@@ -257,7 +354,8 @@ class ParaphraseService:
         return {
             'loaded': self.is_loaded,
             'model_name': self.model_name,
-            'device': 'api' if self.is_loaded else 'offline'
+            'device': 'api' if self.is_loaded else 'offline',
+            'engines': self.router.get_status()
         }
     
     def reload_model(self):
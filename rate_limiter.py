@@ -1,5 +1,6 @@
+import threading
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,73 +8,130 @@ logger = logging.getLogger(__name__)
 class RateLimiter:
     def __init__(self, max_requests_per_minute: int = 60):
         self.max_requests_per_minute = max_requests_per_minute
-        self.requests: Dict[str, List[float]] = {}
+        # Each entry is (timestamp, cost) so the same limiter can meter
+        # requests (cost 1) or other units such as characters
+        self.requests: Dict[str, List[Tuple[float, int]]] = {}
         self.window_size = 60  # 1 minute window
+        # Served from a threaded worker, so every read-modify-write of
+        # self.requests must hold this lock
+        self._lock = threading.Lock()
     
-    def is_allowed(self, client_id: str) -> bool:
+    def is_allowed(self, client_id: str, cost: int = 1, limit: Optional[int] = None) -> bool:
         """
         Check if a request is allowed for the given client
         
         Args:
-            client_id: Unique identifier for the client (usually IP address)
+            client_id: Unique identifier for the client (API key or IP address)
+            cost: Units the request would consume (defaults to one request)
+            limit: Per-client limit overriding max_requests_per_minute
             
         Returns:
             True if request is allowed, False if rate limit exceeded
         """
-        current_time = time.time()
+        with self._lock:
+            return self._check(client_id, cost, limit, time.time())
+    
+    def reserve(self, client_id: str, cost: int = 1, limit: Optional[int] = None) -> bool:
+        """
+        Check the limit and record the cost in one atomic step
         
-        # Initialize client if not exists
-        if client_id not in self.requests:
-            self.requests[client_id] = []
+        Use this instead of is_allowed/record_request when requests run
+        concurrently, so in-flight work counts against the limit. Call
+        refund if the reserved work ends up not being done.
         
-        # Clean old requests outside the window
-        self._clean_old_requests(client_id, current_time)
-        
-        # Check if client has exceeded rate limit
-        if len(self.requests[client_id]) >= self.max_requests_per_minute:
-            logger.warning(f"Rate limit exceeded for client: {client_id}")
-            return False
-        
-        return True
+        Args:
+            client_id: Unique identifier for the client
+            cost: Units the request consumes
+            limit: Per-client limit overriding max_requests_per_minute
+            
+        Returns:
+            True if the cost was reserved, False if rate limit exceeded
+        """
+        with self._lock:
+            current_time = time.time()
+            if not self._check(client_id, cost, limit, current_time):
+                return False
+            
+            self.requests[client_id].append((current_time, cost))
+            return True
     
-    def record_request(self, client_id: str):
+    def refund(self, client_id: str, cost: int = 1):
+        """Remove the most recent reservation of the given cost"""
+        with self._lock:
+            entries = self.requests.get(client_id, [])
+            for i in range(len(entries) - 1, -1, -1):
+                if entries[i][1] == cost:
+                    del entries[i]
+                    return
+    
+    def record_request(self, client_id: str, cost: int = 1):
         """
         Record a successful request for the client
         
         Args:
             client_id: Unique identifier for the client
+            cost: Units consumed by the request
         """
-        current_time = time.time()
-        
+        with self._lock:
+            current_time = time.time()
+            
+            if client_id not in self.requests:
+                self.requests[client_id] = []
+            
+            self.requests[client_id].append((current_time, cost))
+            self._clean_old_requests(client_id, current_time)
+    
+    def _check(self, client_id: str, cost: int, limit: Optional[int], current_time: float) -> bool:
+        """Check the limit for a client; caller must hold the lock"""
+        # Initialize client if not exists
         if client_id not in self.requests:
             self.requests[client_id] = []
         
-        self.requests[client_id].append(current_time)
+        # Clean old requests outside the window
         self._clean_old_requests(client_id, current_time)
+        
+        # Check if client has exceeded rate limit
+        if limit is None:
+            limit = self.max_requests_per_minute
+        
+        if self._usage(client_id) + cost > limit:
+            logger.warning(f"Rate limit exceeded for client: {client_id}")
+            return False
+        
+        return True
     
     def _clean_old_requests(self, client_id: str, current_time: float):
         """Remove requests older than the window size"""
         if client_id in self.requests:
             cutoff_time = current_time - self.window_size
             self.requests[client_id] = [
-                req_time for req_time in self.requests[client_id] 
-                if req_time > cutoff_time
+                entry for entry in self.requests[client_id] 
+                if entry[0] > cutoff_time
             ]
     
-    def get_remaining_requests(self, client_id: str) -> int:
-        """Get number of remaining requests for the client"""
-        if client_id not in self.requests:
-            return self.max_requests_per_minute
-        
-        current_time = time.time()
-        self._clean_old_requests(client_id, current_time)
+    def _usage(self, client_id: str) -> int:
+        """Total cost recorded for the client within the current window"""
+        return sum(cost for _, cost in self.requests.get(client_id, []))
+    
+    def get_remaining_requests(self, client_id: str, limit: Optional[int] = None) -> int:
+        """Get number of remaining requests (or units) for the client"""
+        if limit is None:
+            limit = self.max_requests_per_minute
         
-        return max(0, self.max_requests_per_minute - len(self.requests[client_id]))
+        with self._lock:
+            if client_id not in self.requests:
+                return limit
+            
+            current_time = time.time()
+            self._clean_old_requests(client_id, current_time)
+            
+            return max(0, limit - self._usage(client_id))
     
     def get_reset_time(self, client_id: str) -> float:
         """Get timestamp when rate limit resets for the client"""
-        if client_id not in self.requests or not self.requests[client_id]:
-            return time.time()
-        
-        oldest_request = min(self.requests[client_id])
-        return oldest_request + self.window_size
+        with self._lock:
+            if client_id not in self.requests or not self.requests[client_id]:
+                return time.time()
+            
+            oldest_request = min(req_time for req_time, _ in self.requests[client_id])
+            return oldest_request + self.window_size